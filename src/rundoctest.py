@@ -7,7 +7,8 @@ __copyright__ = "Copyright 2021-2024, Damon Lynch"
 
 import doctest
 
-from showinfm.system.linux import wsl_transform_path_uri
+from showinfm.system.linux import mimeapps_default_application, wsl_transform_path_uri
 
 if __name__ == "__main__":
+    doctest.run_docstring_examples(mimeapps_default_application, globals())
     doctest.run_docstring_examples(wsl_transform_path_uri, globals())
@@ -5,19 +5,23 @@
 Parse command line arguments
 """
 
+import functools
 import importlib.metadata
 from argparse import ArgumentParser, HelpFormatter
 
 
+@functools.lru_cache(maxsize=1)
 def package_metadata():
     """
     Get Python package metadata
 
+    The metadata is read once and cached.
+
     :return: version number and package summary
     """
 
     try:
-        version = importlib.metadata.version("show-in-file-manager")
+        metadata = importlib.metadata.metadata("show-in-file-manager")
     except Exception:
         version = "Unknown version"
         summary = (
@@ -26,7 +30,7 @@ def package_metadata():
         )
 
     else:
-        metadata = importlib.metadata.metadata("show-in-file-manager")
+        version = metadata["version"]
         summary = metadata["summary"]
 
     return version, summary
@@ -15,11 +15,24 @@ class FileManagerType(Enum):
     dual_panel = 8  # file_manager "File1" "File2"
 
 
+# Argument to pass a file manager of this type to have it select files. Types not
+# listed take no argument.
+FileManagerTypeArgument = {
+    FileManagerType.win_select: "/select,",
+    FileManagerType.select: "--select",
+    FileManagerType.show_item: "--show-item",
+    FileManagerType.show_items: "--show-items",
+    FileManagerType.reveal: "--reveal",
+}
+
+
 class Platform(Enum):
     windows = 1
     linux = 2
     macos = 3
 
 
-single_file_only = ("explorer.exe", "pcmanfm", "open", "cutefish-filemanager")
-cannot_open_uris = ("fman", "fman.exe", "lumina-fm")
+single_file_only = frozenset(
+    {"explorer.exe", "pcmanfm", "open", "cutefish-filemanager"}
+)
+cannot_open_uris = frozenset({"fman", "fman.exe", "lumina-fm"})
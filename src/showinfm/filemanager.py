@@ -1,35 +1,72 @@
 # SPDX-FileCopyrightText: Copyright 2016-2024 Damon Lynch
 # SPDX-License-Identifier: MIT
 
+import functools
 import os
-import platform
-import shlex
 import subprocess
 import sys
+import threading
 import urllib.parse
 from pathlib import Path
-from typing import List, NamedTuple, Optional, Sequence, Union
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
 
-from showinfm.constants import FileManagerType, Platform, single_file_only
+from showinfm.constants import (
+    FileManagerType,
+    FileManagerTypeArgument,
+    single_file_only,
+)
 from showinfm.system import (
-    current_platform,
+    is_linux,
+    is_macos,
+    is_windows,
     is_wsl,
     is_wsl1,
     is_wsl2,
     linux,
     tools,
-    windows,
 )
 
 PathOrUri = Union[str, Sequence[str]]
 
 
+def _parent(path: str) -> str:
+    """
+    Get the parent of a path, as pathlib's Path.parent would.
+
+    Trailing slashes, as are common in directory URIs, are ignored.
+
+    :param path: normalized path, or the path component of a URI
+    :return: parent directory
+    """
+
+    return os.path.dirname(path.rstrip("/") or "/") or "."
+
+
+def _split_file_uri(uri: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a plain file:// URI into its scheme and host, and its path, without
+    fully parsing it.
+
+    :param uri: URI to split
+    :return: tuple of the scheme and host prefix, and the still percent-encoded
+     path, or None if the URI is not a file:// URI or has a query or fragment
+    """
+
+    if not uri.startswith("file://") or "?" in uri or "#" in uri:
+        return None
+    path_start = uri.find("/", 7)
+    if path_start == -1:
+        return None
+    return uri[:path_start], uri[path_start:]
+
+
 class ProcessPathOrUri(NamedTuple):
     fully_processed: bool
-    path: Optional[Path]
+    path: Optional[str]
     uri: Optional[str]
 
 
+@functools.lru_cache(maxsize=None)
 def valid_file_manager() -> str:
     """
     Get user's file manager, falling back to using sensible defaults.
@@ -43,45 +80,77 @@ def valid_file_manager() -> str:
     All exceptions are caught, except those if this platform is not supported by
     this package.
 
+    The result is cached for the lifetime of the process.
+
     :return: If the user's default file manager is set and it is recognized
      as valid by this package, then return it. Otherwise return the stock file
      manager, if it exists.
     """
 
-    if current_platform == Platform.windows or is_wsl1:
+    if is_windows or is_wsl1:
         file_manager = "explorer.exe"
-    elif current_platform == Platform.linux:
+    elif is_linux:
         file_manager = linux.valid_linux_file_manager()
-    elif current_platform == Platform.macos:
+    elif is_macos:
         file_manager = "open"
     else:
         raise NotImplementedError
     return file_manager
 
 
+@functools.lru_cache(maxsize=None)
 def _file_manager_type(fm: str) -> FileManagerType:
     """
     Determine file manager type via the executable name
+
+    The result is cached per executable name, because determining it can require
+    running the file manager, e.g. to get the version of caja.
+
     :param fm: executable name
     :return:
     """
 
-    if current_platform == Platform.windows or is_wsl1:
+    if is_windows or is_wsl1:
+        # Only Windows and WSL1 need the windows module
+        from showinfm.system import windows
+
         return windows.windows_file_manager_type(fm)
-    elif current_platform == Platform.linux:
+    elif is_linux:
         return linux.linux_file_manager_type(fm)
-    elif current_platform == Platform.macos:
+    elif is_macos:
         return FileManagerType.reveal
     else:
         raise NotImplementedError
 
 
+_probe_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _probe_valid_file_manager() -> Tuple[Optional[str], Optional[FileManagerType]]:
+    """
+    Probe for a valid file manager for this user in this desktop environment,
+    and determine its type.
+
+    The result is cached, so the probe is run only once per process. If an
+    exception is raised, nothing is cached and the probe is run again next time.
+
+    Calls made after the result is cached do not take the lock. Threads that
+    miss the cache at the same time wait for the first one to finish probing.
+
+    :return: tuple of file manager executable name and its type, or None and None
+     if there is no valid file manager
+    """
+
+    with _probe_lock:
+        fm = valid_file_manager()
+        if fm:
+            return fm, _file_manager_type(fm)
+        return None, None
+
+
 class FileManager:
     def __init__(self) -> None:
-        self._valid_file_manager_probed: bool = False
-        self._valid_file_manager: Optional[str] = None
-        self._valid_file_manager_type: Optional[FileManagerType] = None
-
         self.file_manager: Optional[str]
         self.file_manager_type: Optional[FileManagerType]
 
@@ -103,6 +172,9 @@ class FileManager:
         self.debug: bool
 
         self.file_manager_specified: bool
+        # Whether the file manager must be passed paths rather than URIs
+        self.file_manager_requires_path: bool
+        self.file_manager_is_explorer: bool
         self.open_not_select_directory: bool
         self.allow_conversion: bool
 
@@ -110,35 +182,49 @@ class FileManager:
         """
         Launch the file manager
 
-        :param uris_or_paths: list of URIs, or a list of a single empty string
-        :param arg: arg to pass the file manager
-        :param file_manager: file manager executable name
-        :param verbose: if True print command to be executed before launching
-         it
+        File managers that can be passed only one path or URI are launched once for
+        each path or URI.
+
+        :param uris_or_paths: list of URIs or paths, which may be empty
         """
 
-        for u in uris_or_paths:
-            cmd = f"{self.file_manager} {self.arg}{u}"
-            if self.verbose:
-                print("Executing", cmd)
-            # Do not check current_platform here, it makes no sense
-            args = shlex.split(cmd) if platform.system() != "Windows" else cmd
-            proc = subprocess.Popen(args)
-            if is_wsl2 and self.file_manager == "explorer.exe":
-                proc.wait()
+        assert self.file_manager
+        if self.file_manager in single_file_only:
+            # Some file managers must be passed only one or zero paths / URIs
+            launches = [[u] for u in uris_or_paths] or [[]]
+        else:
+            launches = [uris_or_paths]
 
-    def _set_valid_file_manager(self) -> None:
-        """
-        Set class level global variables to set a valid file manager for this user
-        in this desktop environment.
-        """
+        # Resolve the file manager on the PATH once, rather than once per launch
+        executable = tools.which(self.file_manager) if not is_windows else None
 
-        if not self._valid_file_manager_probed:
-            fm = valid_file_manager()
-            if fm:
-                self._valid_file_manager = fm
-                self._valid_file_manager_type = _file_manager_type(fm)
-            self._valid_file_manager_probed = True
+        for targets in launches:
+            args = [self.file_manager]
+            if self.arg.endswith(","):
+                # The argument and the path must be passed as one, e.g.
+                # explorer.exe /select,C:\some\file.txt
+                args.extend(f"{self.arg}{t}" for t in targets)
+            else:
+                if self.arg:
+                    args.append(self.arg)
+                args.extend(targets)
+
+            # Native Windows only. Under WSL even explorer.exe is launched from
+            # Linux, so it takes an argument list like any other program
+            if is_windows:
+                # Paths have already been quoted for the Windows command line
+                cmd = " ".join(args)
+                if self.verbose:
+                    print("Executing", cmd)
+                proc = subprocess.Popen(cmd)
+            else:
+                if self.verbose:
+                    import shlex
+
+                    print("Executing", shlex.join(args))
+                proc = subprocess.Popen(args, executable=executable)
+            if is_wsl2 and self.file_manager == "explorer.exe":
+                proc.wait()
 
     def show_in_file_manager(
         self,
@@ -158,9 +244,7 @@ class FileManager:
         self.file_manager_specified = self.file_manager is not None
 
         if not self.file_manager:
-            self._set_valid_file_manager()
-            self.file_manager_type = self._valid_file_manager_type
-            self.file_manager = self._valid_file_manager
+            self.file_manager, self.file_manager_type = _probe_valid_file_manager()
         else:
             try:
                 self.file_manager_type = _file_manager_type(self.file_manager)
@@ -171,6 +255,11 @@ class FileManager:
             # There is no file manager -- there is nothing to be done
             return
 
+        self.file_manager_requires_path = tools.filemanager_requires_path(
+            file_manager=self.file_manager
+        )
+        self.file_manager_is_explorer = self.file_manager == "explorer.exe"
+
         self.arg = ""
         self.locations = []
         self.directories = []
@@ -180,7 +269,7 @@ class FileManager:
         self.wsl_windows_paths = []
         self.wsl_windows_directories = []
 
-        if not path_or_uri and current_platform == Platform.macos:
+        if not path_or_uri and is_macos:
             # macOS finder requires a path to be able to launch it from the
             # command line
             path_or_uri = "file:///"
@@ -202,15 +291,14 @@ class FileManager:
          and if not, a Path or URI to process further
         """
 
-        require_win_path = self.file_manager == "explorer.exe"
-        wsl_details = linux.wsl_transform_path_uri(pu, require_win_path)
+        wsl_details = linux.wsl_transform_path_uri(pu, self.file_manager_is_explorer)
         if not wsl_details.exists:
             if self.debug:
                 print(f"Path does not exist: '{pu}'", file=sys.stderr)
             return ProcessPathOrUri(fully_processed=True, path=None, uri=None)
         use_windows_explorer_via_wsl = (
             wsl_details.is_win_location and not self.file_manager_specified
-        ) or self.file_manager == "explorer.exe"
+        ) or self.file_manager_is_explorer
         if use_windows_explorer_via_wsl:
             if wsl_details.win_uri is None:
                 if self.debug:
@@ -238,12 +326,13 @@ class FileManager:
                     )
                 return ProcessPathOrUri(fully_processed=True, path=None, uri=None)
             assert self.file_manager
-            if tools.filemanager_requires_path(file_manager=self.file_manager):
-                path = Path(wsl_details.linux_path).resolve()
+            path = os.path.realpath(wsl_details.linux_path)
+            if self.file_manager_requires_path:
                 uri = None
             else:
-                path = None
-                uri = Path(wsl_details.linux_path).resolve().as_uri()
+                # Keep the resolved path alongside the URI built from it, so it
+                # need not be recovered by parsing the URI later
+                uri = tools.path_to_file_uri(path)
             return ProcessPathOrUri(fully_processed=False, path=path, uri=uri)
 
     def _process_path_or_uri_non_wsl(self, pu: str) -> ProcessPathOrUri:
@@ -257,65 +346,78 @@ class FileManager:
 
         assert self.file_manager
         if tools.is_uri(pu):
-            if (
-                tools.filemanager_requires_path(file_manager=self.file_manager)
-                and self.allow_conversion
-            ):
+            if self.file_manager_requires_path and self.allow_conversion:
                 # Convert URI to a regular path
                 uri = None
-                path = Path(tools.file_uri_to_path(pu))
+                path = tools.file_uri_to_path(pu)
             else:
                 uri = pu
                 path = None
         else:
-            if (
-                tools.filemanager_requires_path(file_manager=self.file_manager)
-                or not self.allow_conversion
-            ):
-                path = Path(pu)
+            if self.file_manager_requires_path or not self.allow_conversion:
+                # Normalize the path the same way pathlib does, without resolving it
+                path = str(Path(pu))
                 uri = None
             else:
-                uri = Path(pu).resolve().as_uri()
-                path = None
+                # Keep the resolved path alongside the URI built from it, so it
+                # need not be recovered by parsing the URI later
+                path = os.path.realpath(pu)
+                uri = tools.path_to_file_uri(path)
 
         return ProcessPathOrUri(fully_processed=False, path=path, uri=uri)
 
     def _process_path_or_uri_no_select(
-        self, path: Optional[Path], uri: Optional[str]
+        self, path: Optional[str], uri: Optional[str]
     ) -> None:
         """
         Process the path or URI when using a file manager that cannot select files
         or directories.
         """
 
-        assert current_platform != Platform.windows
+        assert not is_windows
         # Show only the directory: do not attempt to select the file,
         # because the file manager cannot handle it.
 
-        if uri:
-            # Do not use tools.file_url_to_path() here, because we need the
-            # parse_result, and file_url_to_path() assumes file:// URIs.
-            # In any case, this code block is not run under Windows, so
-            # there is no need to use tools.file_url_to_path() to handle the
-            # file:/// case that urllib.parse.urlparse fails with.
-            parse_result = urllib.parse.urlparse(uri)
-            path = Path(parse_result.path)
-        else:
-            parse_result = None
-
-        assert path is not None
+        if path is not None:
+            # A local path, and possibly the URI that was built from it
+            if not (os.path.isdir(path) and self.open_not_select_directory):
+                path = _parent(path)
+                if uri:
+                    uri = tools.path_to_file_uri(path)
+            self.locations.append(uri or path)
+            return
 
-        if not (path.is_dir() and self.open_not_select_directory):
-            path = path.parent
-        if uri:
-            assert parse_result is not None
-            uri = str(urllib.parse.urlunparse(parse_result._replace(path=str(path))))
+        assert uri is not None
+        # Split plain file:// URIs directly. Fall back to urllib.parse.urlparse for
+        # other schemes, or for URIs with a query or fragment. Either way, keep
+        # the scheme and host, so only the path is replaced below.
+        # Do not use tools.file_uri_to_path() here, because it assumes file://
+        # URIs. In any case, this code block is not run under Windows, so the
+        # file:/// case that urllib.parse.urlparse fails with there does not arise.
+        split = _split_file_uri(uri)
+        if split is not None:
+            prefix, uri_path = split
         else:
-            path = tools.quote_path(path=path)
-        self.locations.append(uri or str(path))
+            parse_result = urllib.parse.urlparse(uri)
+            uri_path = parse_result.path
+            if uri_path and uri.endswith(uri_path):
+                # The path is the last component of the URI
+                prefix = uri[: -len(uri_path)]
+            else:
+                prefix = None
+        is_dir = os.path.isdir(urllib.parse.unquote(uri_path))
+        if not (is_dir and self.open_not_select_directory):
+            # Work with the still percent-encoded path, so the URI remains valid
+            parent = _parent(uri_path)
+            if prefix is not None:
+                # Swap the path for its parent, leaving the scheme and host untouched
+                uri = f"{prefix}{parent}"
+            else:
+                uri = urllib.parse.urlunparse(parse_result._replace(path=parent))
+        self.locations.append(uri)
 
     def _process_path_or_uri_can_select(
-        self, path: Optional[Path], uri: Optional[str]
+        self, path: Optional[str], uri: Optional[str]
     ) -> None:
         """
         Process the path or URI when using a file manager that can select files
@@ -331,12 +433,10 @@ class FileManager:
             and self.file_manager_type != FileManagerType.dual_panel
             or self.file_manager_type == FileManagerType.regular
         ):
-            if uri:
-                path = Path(tools.file_uri_to_path(uri=uri))
-                open_directory = path.is_dir()
-            else:
-                assert path is not None
-                open_directory = path.is_dir()
+            if path is None:
+                assert uri is not None
+                path = tools.file_uri_to_path(uri=uri)
+            open_directory = os.path.isdir(path)
             if open_directory:
                 if (
                     self.file_manager_type == FileManagerType.regular
@@ -347,16 +447,16 @@ class FileManager:
                     # to distinguish between selecting and opening a
                     # directory.
                     # So open the parent instead.
-                    path = path.parent
+                    path = _parent(path)
                     if uri:
-                        uri = path.as_uri()
-                if uri is None:
-                    path = tools.quote_path(path=path)
-                self.directories.append(uri or str(path))
+                        uri = tools.path_to_file_uri(path)
+                if uri is None and is_windows:
+                    path = str(tools.quote_path(path=Path(path)))
+                self.directories.append(uri or path)
         if not open_directory:
-            if uri is None and self.file_manager != "explorer.exe":
+            if uri is None and is_windows and not self.file_manager_is_explorer:
                 assert path is not None
-                path = tools.quote_path(path=path)
+                path = str(tools.quote_path(path=Path(path)))
             self.locations.append(uri or str(path))
 
     def _process_path_or_uri(self, path_or_uri: PathOrUri) -> None:
@@ -364,50 +464,42 @@ class FileManager:
         Examines the path or URI and processes it according to the needs of the
         file manager.
 
-        :param path_or_uri: path or URI to process
+        :param path_or_uri: path or URI to process, or a sequence of them
         """
 
         if isinstance(path_or_uri, str):
-            # turn the single path / URI into a Sequence
+            # Turn the single path / URI into a Sequence
             path_or_uri = (path_or_uri,)
 
-        filtered_path_or_uri = (p_or_u for p_or_u in path_or_uri if p_or_u)
-        for pu in filtered_path_or_uri:
-            if is_wsl:
-                p = self._process_path_or_uri_wsl(pu)
-                if p.fully_processed:
-                    continue
-            else:
-                p = self._process_path_or_uri_non_wsl(pu)
-
-            path = p.path
-            uri = p.uri
-            assert path is not None or uri is not None
+        # Choose how to process each path or URI once, not once per item
+        if is_wsl:
+            process = self._process_path_or_uri_wsl
+        else:
+            process = self._process_path_or_uri_non_wsl
+        if self.file_manager_type == FileManagerType.dir_only_uri:
+            add_location = self._process_path_or_uri_no_select
+        else:
+            add_location = self._process_path_or_uri_can_select
 
-            if self.file_manager_type == FileManagerType.dir_only_uri:
-                self._process_path_or_uri_no_select(path, uri)
-            else:
-                self._process_path_or_uri_can_select(path, uri)
+        for pu in path_or_uri:
+            if not pu:
+                continue
+            p = process(pu)
+            if p.fully_processed:
+                continue
+            assert p.path is not None or p.uri is not None
+            add_location(p.path, p.uri)
 
     def _set_file_manager_argument(self) -> None:
-        self.arg = ""
-        if self.file_manager_type == FileManagerType.win_select:
-            self.arg = "/select,"  # no trailing space is necessary on Windows
-        elif self.file_manager_type == FileManagerType.select:
-            self.arg = "--select "  # trailing space is necessary
-        elif self.file_manager_type == FileManagerType.show_item:
-            self.arg = "--show-item "  # trailing space is necessary
-        elif self.file_manager_type == FileManagerType.show_items:
-            self.arg = "--show-items "  # trailing space is necessary
-        elif self.file_manager_type == FileManagerType.reveal:
-            self.arg = "--reveal "  # trailing space is necessary
+        if self.file_manager_type is None:
+            self.arg = ""
+        else:
+            self.arg = FileManagerTypeArgument.get(self.file_manager_type, "")
 
     def _launch(self) -> None:
-        if (
-            current_platform == Platform.windows
-            and not is_wsl
-            and self.file_manager == "explorer.exe"
-        ):
+        if is_windows and not is_wsl and self.file_manager == "explorer.exe":
+            from showinfm.system import windows
+
             if self.locations:
                 windows.launch_file_explorer(self.locations, self.verbose)
             for d in self.directories:
@@ -416,14 +508,8 @@ class FileManager:
                 os.startfile(d)  # type: ignore[attr-defined]
         else:
             if self.locations:
-                # Some file managers must be passed only one or zero paths / URIs
-                if self.file_manager not in single_file_only:
-                    self.locations = [" ".join(self.locations)]
-
                 self._launch_file_manager(uris_or_paths=self.locations)
             if self.directories:
-                if self.file_manager not in single_file_only:
-                    self.directories = [" ".join(self.directories)]
                 self.arg = ""
                 self._launch_file_manager(uris_or_paths=self.directories)
             if self.wsl_windows_paths:
@@ -442,4 +528,4 @@ class FileManager:
             and not self.wsl_windows_directories
         ):
             self.arg = ""
-            self._launch_file_manager(uris_or_paths=[""])
+            self._launch_file_manager(uris_or_paths=[])
@@ -7,18 +7,26 @@ Show in File Manager
 Open the system file manager and optionally select files in it.
 """
 
-import shutil
+import functools
 import sys
 from typing import Optional, Sequence, Union
 
 import showinfm.filemanager
-from showinfm.argumentsparse import get_parser
-from showinfm.constants import Platform
-from showinfm.system import current_platform, is_wsl, is_wsl1, is_wsl2, linux, windows
+from showinfm.system import (
+    is_linux,
+    is_macos,
+    is_windows,
+    is_wsl,
+    is_wsl1,
+    is_wsl2,
+    linux,
+    tools,
+)
 
 _file_manager = showinfm.filemanager.FileManager()
 
 
+@functools.lru_cache(maxsize=None)
 def stock_file_manager() -> str:
     """
     Get stock file manager for this operating system / desktop.
@@ -28,45 +36,48 @@ def stock_file_manager() -> str:
     default file manager. On macOS, the default is finder, accessed
     via the command 'open'.
 
-    Exceptions are not caught.
+    Exceptions are not caught. The result is cached for the lifetime of the
+    process.
 
     :return: executable name
     """
 
-    if current_platform == Platform.windows or is_wsl1:
+    if is_windows or is_wsl1:
         file_manager = "explorer.exe"
-    elif current_platform == Platform.linux:
+    elif is_linux:
         file_manager = linux.stock_linux_file_manager()
-    elif current_platform == Platform.macos:
+    elif is_macos:
         file_manager = "open"
     else:
         raise NotImplementedError
 
-    assert shutil.which(file_manager) is not None
+    assert tools.which(file_manager) is not None
     return file_manager
 
 
+@functools.lru_cache(maxsize=None)
 def user_file_manager() -> str:
     """
     Get the file manager as set by the user.
 
     The file manager executable is tested to see if it exists.
 
-    Exceptions are not caught.
+    Exceptions are not caught. The result is cached for the lifetime of the
+    process.
 
     :return: executable name
     """
 
-    if current_platform == Platform.windows or is_wsl1:
+    if is_windows or is_wsl1:
         file_manager = "explorer.exe"
-    elif current_platform == Platform.linux:
+    elif is_linux:
         file_manager = linux.user_linux_file_manager()
-    elif current_platform == Platform.macos:
+    elif is_macos:
         file_manager = "open"
     else:
         raise NotImplementedError
 
-    assert shutil.which(file_manager) is not None
+    assert tools.which(file_manager) is not None
     return file_manager
 
 
@@ -81,7 +92,7 @@ def valid_file_manager() -> str:
     manager for the detected desktop environment.
 
     All exceptions are caught, except those if this platform is not supported by
-    this package.
+    this package. The result is cached for the lifetime of the process.
 
     :return: If the user's default file manager is set and it is recognized
      as valid by this package, then return it. Otherwise return the stock file
@@ -150,8 +161,6 @@ def show_in_file_manager(
     :param debug: if True print debugging information to stderr
     """
 
-    global _file_manager
-
     _file_manager.show_in_file_manager(
         path_or_uri,
         open_not_select_directory,
@@ -165,40 +174,45 @@ def show_in_file_manager(
 class Diagnostics:
     """
     Collect basic diagnostics information for this package.
-    """
 
-    def __init__(self) -> None:
-        self.desktop: Optional[linux.LinuxDesktop]
-        self.wsl_version: str
+    Each value is determined only when it is first accessed.
+    """
 
+    @functools.cached_property
+    def stock_file_manager(self) -> str:
         try:
-            self.stock_file_manager = stock_file_manager()
+            return stock_file_manager()
         except Exception as e:
-            self.stock_file_manager = str(e)
+            return str(e)
+
+    @functools.cached_property
+    def user_file_manager(self) -> str:
         try:
-            self.user_file_manager = user_file_manager()
+            return user_file_manager()
         except Exception as e:
-            self.user_file_manager = str(e)
+            return str(e)
+
+    @functools.cached_property
+    def valid_file_manager(self) -> str:
         try:
-            self.valid_file_manager = valid_file_manager()
+            return valid_file_manager()
         except Exception as e:
-            self.valid_file_manager = str(e)
+            return str(e)
 
-        if current_platform == Platform.linux:
+    @functools.cached_property
+    def desktop(self) -> Optional[linux.LinuxDesktop]:
+        if is_linux:
             try:
-                self.desktop = linux.linux_desktop()
+                return linux.linux_desktop()
             except Exception:
-                self.desktop = linux.LinuxDesktop.unknown
-        else:
-            self.desktop = None
+                return linux.LinuxDesktop.unknown
+        return None
 
+    @functools.cached_property
+    def wsl_version(self) -> str:
         if is_wsl:
-            if is_wsl2:
-                self.wsl_version = "2"
-            else:
-                self.wsl_version = "1"
-        else:
-            self.wsl_version = ""
+            return "2" if is_wsl2 else "1"
+        return ""
 
     def __str__(self) -> str:
         desktop = f"Linux Desktop: {self.desktop.name}\n" if self.desktop else ""
@@ -212,6 +226,9 @@ class Diagnostics:
 
 
 def main() -> None:
+    # Only the command line needs argparse and the package metadata
+    from showinfm.argumentsparse import get_parser
+
     parser = get_parser()
 
     args = parser.parse_args()
@@ -222,7 +239,9 @@ def main() -> None:
         print(Diagnostics())
         verbose = True
 
-    if current_platform == Platform.windows and not is_wsl:
+    if is_windows and not is_wsl:
+        from showinfm.system import windows
+
         path_or_uri = windows.parse_command_line_arguments(args.path)
     else:
         path_or_uri = args.path
@@ -1,29 +1,42 @@
 # SPDX-FileCopyrightText: Copyright 2021-2024 Damon Lynch
 # SPDX-License-Identifier: MIT
 
-import platform
+import sys
 from typing import Union
 
 from ..constants import Platform
 from . import linux
 
 current_platform: Union[Platform, None]
-system = platform.system()
+# Same values as platform.system(), which on Windows can run an external command
+system: str
+# Plain booleans, so callers need not compare current_platform on every call
+is_windows: bool = False
+is_linux: bool = False
+is_macos: bool = False
 is_wsl: bool = False
 is_wsl1: bool = False
 is_wsl2: bool = False
-if system == "Windows":
+if sys.platform == "win32":
+    system = "Windows"
     current_platform = Platform.windows
-elif system == "Linux":
+    is_windows = True
+elif sys.platform.startswith("linux"):
+    system = "Linux"
     current_platform = Platform.linux
-    if linux.detect_wsl():
+    is_linux = True
+    wsl = linux.wsl_version()
+    if wsl is not None:
         is_wsl = True
-        if linux.wsl_version() == linux.LinuxDesktop.wsl2:
+        if wsl == linux.LinuxDesktop.wsl2:
             is_wsl2 = True
         else:
             is_wsl1 = True
-elif system == "Darwin":
+elif sys.platform == "darwin":
+    system = "Darwin"
     current_platform = Platform.macos
+    is_macos = True
 else:
+    system = ""
     current_platform = None
     raise NotImplementedError
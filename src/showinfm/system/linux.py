@@ -5,29 +5,17 @@
 import functools
 import os
 import re
-import shlex
-import shutil
+import stat
 import subprocess
-import urllib.request
 from enum import Enum
 from pathlib import Path, PureWindowsPath
-from typing import NamedTuple, Optional, Tuple
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Tuple
 from urllib.parse import unquote, urlparse
 
-import packaging.version
-
-try:
-    import xdg  # type: ignore
-    from xdg import BaseDirectory
-    from xdg.DesktopEntry import DesktopEntry  # type: ignore
-
-    have_xdg = True
-except ImportError:
-    have_xdg = False
-
 from showinfm.constants import FileManagerType
 
-_linux_desktop: Optional["LinuxDesktop"] = None
+if TYPE_CHECKING:
+    import packaging.version
 
 
 def stock_linux_file_manager() -> str:
@@ -41,77 +29,195 @@ def stock_linux_file_manager() -> str:
     :return: executable name
     """
 
-    global _linux_desktop
-    if _linux_desktop is None:
-        _linux_desktop = linux_desktop()
+    desktop = linux_desktop().name
+    desktop = LinuxDesktopFamily.get(desktop, desktop)
+
+    file_manager = StandardLinuxFileManager.get(desktop)
+    if file_manager is None:
+        raise Exception(f"The desktop {desktop} is unknown")
+    return file_manager
+
+
+def desktop_file_path(desktop_file: str, data_dirs: List[str]) -> str:
+    """
+    Locate an installed .desktop file.
+
+    :param desktop_file: name of the .desktop file, e.g. org.gnome.Nautilus.desktop
+    :param data_dirs: XDG data directories, most important first
+    :return: full path to the .desktop file, or an empty string if it is not
+     installed
+    """
+
+    for d in data_dirs:
+        path = os.path.join(d, "applications", desktop_file)
+        if os.path.isfile(path):
+            return path
+    return ""
+
+
+def _mimeapps_list_defaults(mimeapps_list: str, mime_type: str) -> List[str]:
+    """
+    Get the default applications set for a MIME type in a mimeapps.list file.
+
+    :param mimeapps_list: full path to the mimeapps.list file
+    :param mime_type: MIME type, e.g. inode/directory
+    :return: list of .desktop file names, in order of preference
+    """
 
+    in_defaults = False
     try:
-        desktop = _linux_desktop.name
-        desktop = LinuxDesktopFamily.get(desktop) or desktop
+        with open(mimeapps_list, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    in_defaults = line == "[Default Applications]"
+                elif in_defaults:
+                    key, _, value = line.partition("=")
+                    if key.strip() == mime_type:
+                        return [d for d in value.strip().split(";") if d]
+    except (OSError, UnicodeDecodeError):
+        pass
+    return []
+
+
+def mimeapps_default_application(
+    mime_type: str, config_dirs: List[str], data_dirs: List[str]
+) -> str:
+    """
+    Determine the default application for a MIME type by reading mimeapps.list
+    files, in the order set out in the XDG MIME Applications Associations
+    specification:
+    https://specifications.freedesktop.org/mime-apps-spec/latest/
 
-        return StandardLinuxFileManager[desktop]
-    except KeyError:
-        raise Exception(f"The desktop {desktop} is unknown")
+    Desktop specific files, e.g. gnome-mimeapps.list, are consulted before the
+    generic mimeapps.list in each directory.
+
+    :param mime_type: MIME type, e.g. inode/directory
+    :param config_dirs: XDG config directories, most important first
+    :param data_dirs: XDG data directories, most important first
+    :return: the first installed .desktop file set as the default, or an empty
+     string if there is none
 
+    >>> import os
+    >>> import tempfile
+    >>> tmp = tempfile.TemporaryDirectory()
+    >>> config_dir = os.path.join(tmp.name, "config")
+    >>> data_dir = os.path.join(tmp.name, "data")
+    >>> os.makedirs(os.path.join(data_dir, "applications"))
+    >>> os.mkdir(config_dir)
+    >>> def write(path, text):
+    ...     with open(path, "w") as f:
+    ...         _ = f.write(text)
+    >>> for app in ("nemo.desktop", "org.gnome.Nautilus.desktop"):
+    ...     write(os.path.join(data_dir, "applications", app), "[Desktop Entry]\\n")
+    >>> write(
+    ...     os.path.join(config_dir, "mimeapps.list"),
+    ...     "[Default Applications]\\ninode/directory=nemo.desktop\\n",
+    ... )
+    >>> write(
+    ...     os.path.join(config_dir, "gnome-mimeapps.list"),
+    ...     "[Default Applications]\\n"
+    ...     "inode/directory=missing.desktop;org.gnome.Nautilus.desktop;\\n",
+    ... )
+    >>> saved_desktop = os.environ.get("XDG_CURRENT_DESKTOP")
+    >>> os.environ["XDG_CURRENT_DESKTOP"] = "ubuntu:GNOME"
+    >>> mimeapps_default_application("inode/directory", [config_dir], [data_dir])
+    'org.gnome.Nautilus.desktop'
+    >>> os.environ["XDG_CURRENT_DESKTOP"] = "KDE"
+    >>> mimeapps_default_application("inode/directory", [config_dir], [data_dir])
+    'nemo.desktop'
+    >>> mimeapps_default_application("text/plain", [config_dir], [data_dir])
+    ''
+    >>> if saved_desktop is None:
+    ...     del os.environ["XDG_CURRENT_DESKTOP"]
+    ... else:
+    ...     os.environ["XDG_CURRENT_DESKTOP"] = saved_desktop
+    >>> tmp.cleanup()
+    """
 
+    desktops = os.environ.get("XDG_CURRENT_DESKTOP", "").lower().split(":")
+    list_names = [f"{d}-mimeapps.list" for d in desktops if d] + ["mimeapps.list"]
+    list_dirs = config_dirs + [os.path.join(d, "applications") for d in data_dirs]
+
+    for list_dir in list_dirs:
+        for list_name in list_names:
+            mimeapps_list = os.path.join(list_dir, list_name)
+            for desktop_file in _mimeapps_list_defaults(mimeapps_list, mime_type):
+                if desktop_file_path(desktop_file, data_dirs):
+                    return desktop_file
+    return ""
+
+
+@functools.lru_cache(maxsize=None)
 def user_linux_file_manager() -> str:
     """
     Determine the file manager for this desktop as set by the user.
 
-    xdg-mime is used to get a .desktop file, from which the executable name is
-    extracted. The executable is not examined to see if it is valid or if it even
-    exists.
+    The default application for inode/directory is read from the user's and the
+    system's mimeapps.list files. If none is set there, xdg-mime is used instead.
+    The executable name is extracted from the resulting .desktop file. The
+    executable is not examined to see if it is valid or if it even exists.
+
+    The result is cached for the lifetime of the process.
 
     All exceptions are raised.
 
     :return: executable name
     """
 
-    if not have_xdg:
+    # The xdg modules are needed only here, so do not import them at module level
+    try:
+        import xdg  # type: ignore
+        from xdg import BaseDirectory
+        from xdg.DesktopEntry import DesktopEntry  # type: ignore
+    except ImportError:
         raise Exception(
             "xdg utilities and/or the python binding for xdg are not installed"
         )
 
-    xdg_cmd = "xdg-mime query default inode/directory"
-    cmd = shlex.split(xdg_cmd)
-    try:
-        desktop_file: str = subprocess.check_output(cmd, universal_newlines=True)
-    except Exception:
-        raise Exception(f"Could not determine file manager using {xdg_cmd}")
+    desktop_file = mimeapps_default_application(
+        "inode/directory", BaseDirectory.xdg_config_dirs, BaseDirectory.xdg_data_dirs
+    )
+
+    if not desktop_file:
+        # xdg-mime also understands legacy and desktop specific configuration
+        xdg_cmd = "xdg-mime query default inode/directory"
+        cmd = xdg_cmd.split()
+        try:
+            desktop_file = subprocess.check_output(cmd, universal_newlines=True)
+        except Exception:
+            raise Exception(f"Could not determine file manager using {xdg_cmd}")
 
-    # Remove new line character from output
-    desktop_file = desktop_file[:-1]
-    if desktop_file.endswith(";"):
+        # Remove new line character from output
         desktop_file = desktop_file[:-1]
+        if desktop_file.endswith(";"):
+            desktop_file = desktop_file[:-1]
 
-    for desktop_path in (Path(d) / "applications" for d in BaseDirectory.xdg_data_dirs):
-        path = desktop_path / desktop_file
-        if path.exists():
-            p = str(path)
-            try:
-                desktop_entry = DesktopEntry(p)
-            except Exception:
-                raise Exception(f"Could not open desktop entry at {p}")
-            try:
-                desktop_entry.parse(p)
-            except xdg.Exceptions.ParsingError:
-                raise Exception(f"Could not parse desktop entry at {p}")
-            except Exception:
-                raise Exception(f"Desktop entry at {p} might be malformed")
+    p = desktop_file_path(desktop_file, BaseDirectory.xdg_data_dirs)
+    if not p:
+        return ""
 
-            fm = desktop_entry.getExec()
+    # Passing the path to the constructor would parse the file, so
+    # parse it explicitly, once, to be able to report what went wrong
+    desktop_entry = DesktopEntry()
+    try:
+        desktop_entry.parse(p)
+    except xdg.Exceptions.ParsingError:
+        raise Exception(f"Could not parse desktop entry at {p}")
+    except Exception:
+        raise Exception(f"Desktop entry at {p} might be malformed")
 
-            # Strip away any extraneous arguments
-            fm_cmd = fm.split()[0]
-            # Strip away any path information
-            fm_cmd = Path(fm_cmd).name
-            # Strip away any quotes
-            fm_cmd = fm_cmd.replace('"', "")
-            fm_cmd = fm_cmd.replace("'", "")
+    fm = desktop_entry.getExec()
 
-            return fm_cmd
+    # Strip away any extraneous arguments
+    fm_cmd = fm.split()[0]
+    # Strip away any path information
+    fm_cmd = Path(fm_cmd).name
+    # Strip away any quotes
+    fm_cmd = fm_cmd.replace('"', "")
+    fm_cmd = fm_cmd.replace("'", "")
 
-    return ""
+    return fm_cmd
 
 
 def valid_linux_file_manager() -> str:
@@ -143,7 +249,10 @@ def valid_linux_file_manager() -> str:
 
     fm = user_fm if user_fm else stock
 
-    if fm and shutil.which(fm):
+    # Imported here because tools depends on the fully initialized system package
+    from showinfm.system.tools import which
+
+    if fm and which(fm):
         return fm
     else:
         return ""
@@ -172,12 +281,14 @@ def linux_file_manager_type(file_manager: str) -> FileManagerType:
     return LinuxFileManagerBehavior.get(file_manager, FileManagerType.regular)
 
 
-def caja_version() -> Optional[packaging.version.Version]:
+def caja_version() -> Optional["packaging.version.Version"]:
     """
     Get the version of Caja via a command line switch
     :return: parsed ver
     """
 
+    import packaging.version
+
     try:
         version_string = (
             subprocess.run(["caja", "--version"], stdout=subprocess.PIPE, check=True)
@@ -202,6 +313,8 @@ def caja_supports_select() -> bool:
     :return: True if caja version is >= version 1.26
     """
 
+    import packaging.version
+
     try:
         version = caja_version()
     except Exception:
@@ -211,11 +324,13 @@ def caja_supports_select() -> bool:
     return version >= packaging.version.Version("1.26")
 
 
+@functools.lru_cache(maxsize=512)
 def translate_wsl_path(path: str, from_windows_to_wsl: bool) -> str:
     """
     Use the WSL command wslpath to translate between Windows and WSL paths.
 
-    Uses subprocesss. Exceptions are not caught.
+    Uses subprocesss. Exceptions are not caught. Successful translations are cached,
+    because wslpath can translate only one path per invocation.
 
     :param path: path to convert in string format
     :param from_windows_to_wsl: whether to translate from Windows to WSL (True),
@@ -527,6 +642,8 @@ def wsl_transform_path_uri(
     >>> os.chdir(cwd)
     """
 
+    import urllib.request
+
     win_uri: Optional[str] = None
     win_path: Optional[str] = None
     linux_path: Optional[str] = None
@@ -580,18 +697,23 @@ def wsl_transform_path_uri(
                     win_uri = wsl_path_to_uri_for_windows_explorer(linux_path)
             else:
                 # relative path was passed
-                linux_path = str(Path(path).resolve())
+                linux_path = os.path.realpath(path)
 
     if linux_path is None:
         is_win_location = None
     else:
-        lpath = Path(linux_path)
-        exists = lpath.exists()
+        # Determine whether the path exists and is a directory with a single stat
+        try:
+            mode = os.stat(linux_path).st_mode
+        except (OSError, ValueError):
+            exists = False
+        else:
+            exists = True
 
         is_win_location = linux_path.startswith("/mnt/")
 
         if exists:
-            is_dir = lpath.is_dir()
+            is_dir = stat.S_ISDIR(mode)
             if generate_win_path or is_win_location:
                 try:
                     win_path = translate_wsl_path(
@@ -644,6 +766,8 @@ def wsl_path_to_uri_for_windows_explorer(path: str) -> str:
     :return: a file URI accepted by Windows Explorer
     """
 
+    import urllib.request
+
     assert not path.startswith("\\\\")
     assert path.startswith("/mnt/")
 
@@ -699,6 +823,19 @@ LinuxDesktopHumanize = dict(
 )
 
 
+# Values of XDG_CURRENT_DESKTOP (lower case) that do not match a LinuxDesktop name
+LinuxDesktopAlias = {
+    "unity:unity7": "unity",
+    "unity:unity7:ubuntu": "unity",
+    "x-cinnamon": "cinnamon",
+    "ubuntu:gnome": "ubuntugnome",
+    "pop:gnome": "popgnome",
+    "gnome-classic:gnome": "gnome",
+    "budgie:gnome": "gnome",
+    "zorin:gnome": "zorin",
+}
+
+
 LinuxDesktopFamily = dict(
     ubuntugnome="gnome",
     popgnome="gnome",
@@ -726,44 +863,49 @@ StandardLinuxFileManager = dict(
 )
 
 
-LinuxFileManagerBehavior = dict(
-    nautilus=FileManagerType.select,
-    dolphin=FileManagerType.select,
-    caja=FileManagerType.dir_only_uri,
-    thunar=FileManagerType.dir_only_uri,
-    nemo=FileManagerType.regular,
-    pcmanfm=FileManagerType.dir_only_uri,
-    peony=FileManagerType.show_items,
-    index=FileManagerType.dir_only_uri,
-    doublecmd=FileManagerType.dual_panel,
-    krusader=FileManagerType.dir_only_uri,
-    spacefm=FileManagerType.dir_only_uri,
-    fman=FileManagerType.dual_panel,
-)
-LinuxFileManagerBehavior["pcmanfm-qt"] = FileManagerType.dir_only_uri
-LinuxFileManagerBehavior["dde-file-manager"] = FileManagerType.show_item
-LinuxFileManagerBehavior["io.elementary.files"] = FileManagerType.regular
-LinuxFileManagerBehavior["cutefish-filemanager"] = FileManagerType.dir_only_uri
-LinuxFileManagerBehavior["lumina-fm"] = FileManagerType.dir_only_uri
+LinuxFileManagerBehavior = {
+    "nautilus": FileManagerType.select,
+    "dolphin": FileManagerType.select,
+    "caja": FileManagerType.dir_only_uri,
+    "thunar": FileManagerType.dir_only_uri,
+    "nemo": FileManagerType.regular,
+    "pcmanfm": FileManagerType.dir_only_uri,
+    "peony": FileManagerType.show_items,
+    "index": FileManagerType.dir_only_uri,
+    "doublecmd": FileManagerType.dual_panel,
+    "krusader": FileManagerType.dir_only_uri,
+    "spacefm": FileManagerType.dir_only_uri,
+    "fman": FileManagerType.dual_panel,
+    "pcmanfm-qt": FileManagerType.dir_only_uri,
+    "dde-file-manager": FileManagerType.show_item,
+    "io.elementary.files": FileManagerType.regular,
+    "cutefish-filemanager": FileManagerType.dir_only_uri,
+    "lumina-fm": FileManagerType.dir_only_uri,
+}
 
 # TODO add "COSMIC Files": cosmic-files https://github.com/pop-os/cosmic-files/tree/master/res
 # TODO don't know what the Cosmic Desktop name is yet as reported by XDG_CURRENT_DESKTOP
 
 
-def wsl_version() -> Optional[LinuxDesktop]:
+@functools.lru_cache(maxsize=1)
+def _proc_version() -> str:
     with open("/proc/version") as f:
-        p = f.read()
-    if p.find("microsoft") > 0 and p.find("WSL2"):
+        return f.read()
+
+
+def wsl_version() -> Optional[LinuxDesktop]:
+    p = _proc_version()
+    # WSL2 kernels are named e.g. 5.15.153.1-microsoft-standard-WSL2, and older
+    # ones 4.19.128-microsoft-standard. WSL1 reports e.g. 4.4.0-19041-Microsoft.
+    if "microsoft" in p:
         return LinuxDesktop.wsl2
-    if p.find("Microsoft") > 0:
+    if "Microsoft" in p:
         return LinuxDesktop.wsl
     return None
 
 
 def detect_wsl() -> bool:
-    with open("/proc/version") as f:
-        p = f.read()
-    return p.lower().find("microsoft") > 0
+    return "microsoft" in _proc_version().lower()
 
 
 @functools.lru_cache(maxsize=None)
@@ -774,27 +916,15 @@ def linux_desktop() -> LinuxDesktop:
     :return: enum representing desktop environment, Desktop.unknown if unknown.
     """
 
-    try:
-        env = os.getenv("XDG_CURRENT_DESKTOP").lower()  # type: ignore
-    except AttributeError:
+    env = os.environ.get("XDG_CURRENT_DESKTOP", "").lower()
+    if not env:
         wsl = wsl_version()
         if wsl is not None:
             return wsl
         else:
             raise Exception("The value for XDG_CURRENT_DESKTOP is not set")
 
-    if env in ("unity:unity7", "unity:unity7:ubuntu"):
-        env = "unity"
-    elif env == "x-cinnamon":
-        env = "cinnamon"
-    elif env == "ubuntu:gnome":
-        env = "ubuntugnome"
-    elif env == "pop:gnome":
-        env = "popgnome"
-    elif env in ("gnome-classic:gnome", "budgie:gnome"):
-        env = "gnome"
-    elif env == "zorin:gnome":
-        env = "zorin"
+    env = LinuxDesktopAlias.get(env, env)
 
     try:
         return LinuxDesktop[env]
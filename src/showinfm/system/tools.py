@@ -2,21 +2,63 @@
 # SPDX-FileCopyrightText: 2008-2021 The pip developers
 # SPDX-License-Identifier: MIT
 
+import functools
 import os
 import re
-import shlex
+import shutil
 from collections import defaultdict
 from pathlib import Path
-from typing import DefaultDict, List
-from urllib.parse import urljoin, urlparse
-from urllib.request import pathname2url, url2pathname
+from typing import DefaultDict, List, Optional
+from urllib.parse import quote_from_bytes, urljoin, urlparse
 
-from showinfm.constants import Platform, cannot_open_uris
-from showinfm.system import current_platform, urivalidate
+from showinfm.constants import cannot_open_uris
+from showinfm.system import is_windows, urivalidate
+
+
+def which(executable: str) -> Optional[str]:
+    """
+    Locate an executable on the PATH using shutil.which().
+
+    The result is cached for the lifetime of the process, because file managers are
+    not expected to be installed or removed while it runs. Changing the PATH
+    environment variable invalidates the cached result.
+
+    :param executable: executable name
+    :return: full path to the executable, or None if it was not found
+    """
+
+    return _which(executable, os.environ.get("PATH"))
+
+
+@functools.lru_cache(maxsize=32)
+def _which(executable: str, path: Optional[str]) -> Optional[str]:
+    """
+    Cached shutil.which()
+
+    :param executable: executable name
+    :param path: value of the PATH environment variable, or None if it is not set
+    :return: full path to the executable, or None if it was not found
+    """
+
+    return shutil.which(executable, path=path)
 
 
 def filemanager_requires_path(file_manager: str) -> bool:
-    return current_platform == Platform.windows or file_manager in cannot_open_uris
+    return is_windows or file_manager in cannot_open_uris
+
+
+@functools.lru_cache(maxsize=None)
+def _uri_pattern() -> "re.Pattern[str]":
+    """
+    Compile the URI validation regular expression.
+
+    It is compiled on first use rather than at import, because compiling it takes
+    several milliseconds.
+
+    :return: compiled regular expression matching a complete URI
+    """
+
+    return re.compile("^%s$" % urivalidate.URI, re.VERBOSE)
 
 
 def is_uri(path_uri: str) -> bool:
@@ -26,9 +68,12 @@ def is_uri(path_uri: str) -> bool:
     :return: True if probably a URI, else False
     """
 
-    if path_uri and path_uri.startswith("camera:/"):
+    if ":" not in path_uri:
+        # Every URI has a scheme followed by a colon
+        return False
+    if path_uri.startswith("camera:/"):
         return True
-    return re.match("^%s$" % urivalidate.URI, path_uri, re.VERBOSE) is not None
+    return _uri_pattern().match(path_uri) is not None
 
 
 def quote_path(path: Path) -> Path:
@@ -48,7 +93,7 @@ def quote_path(path: Path) -> Path:
     """
 
     p = str(path)
-    if current_platform == Platform.windows:
+    if is_windows:
         # Double quotes are not allowed in paths names - they are used for quoting
 
         if re.match("""'(.*)'""", p) is not None:
@@ -59,6 +104,8 @@ def quote_path(path: Path) -> Path:
             return Path(f'"{path}"')
     else:
         if not (p[0] in ('"', "'") and p[-1] == p[0]):
+            import shlex
+
             return Path(shlex.quote(p))
     return path
 
@@ -68,15 +115,40 @@ def path_to_file_uri(path: str) -> str:
     Convert a path to a file: URL.  The path will be made absolute and have
     quoted path parts.
 
+    On POSIX the URL is the same as pathlib's Path.as_uri() would give, including
+    for file names that are not valid UTF-8.
+
     Taken from pip: https://github.com/pypa/pip/blob/main/src/pip/_internal/utils/urls.py
     Copyright (c) 2008-2021 The pip developers
     """
 
-    path = os.path.normpath(os.path.abspath(path))
+    # The absolute path depends on the working directory, so it cannot be cached
+    return _absolute_path_to_file_uri(os.path.normpath(os.path.abspath(path)))
+
+
+@functools.lru_cache(maxsize=512)
+def _absolute_path_to_file_uri(path: str) -> str:
+    """
+    Convert a normalized absolute path to a file: URL.
+
+    :param path: normalized absolute path
+    :return: file: URL
+    """
+
+    if not is_windows:
+        # On POSIX pathname2url() only percent-encodes the path, so do that
+        # directly and avoid importing urllib.request. Encode the path's bytes
+        # as pathlib's as_uri() does, so names that are not valid UTF-8 work
+        return f"file://{quote_from_bytes(os.fsencode(path))}"
+
+    # urllib.request is slow to import, and only these functions need it
+    from urllib.request import pathname2url
+
     url = urljoin("file:", pathname2url(path))
     return url
 
 
+@functools.lru_cache(maxsize=512)
 def file_uri_to_path(uri: str) -> str:
     """
     Convert a file: URL to a path.
@@ -88,6 +160,8 @@ def file_uri_to_path(uri: str) -> str:
     and modified by Damon Lynch 2021, 2024
     """
 
+    from urllib.request import url2pathname
+
     parsed = urlparse(uri)
     host = f"{os.path.sep}{os.path.sep}{parsed.netloc}{os.path.sep}"
     p = os.path.normpath(os.path.join(host, url2pathname(parsed.path)))
@@ -16,9 +16,10 @@ from showinfm.system.tools import (
     path_to_file_uri,
 )
 
-WindowsFileManagerBehavior = {}
-WindowsFileManagerBehavior["doublecmd.exe"] = FileManagerType.dual_panel
-WindowsFileManagerBehavior["fman.exe"] = FileManagerType.dual_panel
+WindowsFileManagerBehavior = {
+    "doublecmd.exe": FileManagerType.dual_panel,
+    "fman.exe": FileManagerType.dual_panel,
+}
 
 
 def windows_file_manager_type(file_manager: str) -> FileManagerType: